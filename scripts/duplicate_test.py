@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Benchmark de idempotencia: crea órdenes y reenvía cada una varias veces,
+simulando los reintentos de un cliente tras un timeout del gateway.
+"""
+
+import requests
+import redis
+import sys
+import time
+import uuid
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from statistics import mean, median
+from rq import Queue
+from rq.job import Job
+
+from load_test import ORDER_SERVICE_URL, clear_database
+
+# Redis expuesto por docker compose, para contar los trabajos de validación
+REDIS_HOST = "localhost"
+REDIS_PORT = 6379
+
+# Tiempo máximo de espera a que el worker vacíe la cola antes de contar trabajos
+JOB_DRAIN_TIMEOUT = 120  # segundos
+
+
+class DuplicateOrderTester:
+    def __init__(self, num_orders=10, replays=20, concurrent=False):
+        self.num_orders = num_orders
+        self.replays = replays
+        self.concurrent = concurrent
+        self.queue = Queue(connection=redis.Redis(host=REDIS_HOST, port=REDIS_PORT))
+
+    def post_order(self, order_id):
+        """Envía una orden y devuelve (latencia en ms, respuesta)."""
+        start = time.perf_counter()
+        response = requests.post(
+            f"{ORDER_SERVICE_URL}/create_order",
+            json={
+                "order_id": order_id,
+                "product": "Test Product",
+                "quantity": 5
+            },
+            timeout=5
+        )
+        return (time.perf_counter() - start) * 1000, response
+
+    def count_stored_orders(self, order_ids):
+        """Cuenta cuántas filas existen en SQLite para los order_id dados."""
+        response = requests.get(f"{ORDER_SERVICE_URL}/get_orders", timeout=5)
+        stored = [order[0] for order in response.json()["orders"]]
+        return sum(1 for order_id in stored if order_id in order_ids)
+
+    def wait_for_queue_drain(self):
+        """Espera a que no queden trabajos en cola ni en ejecución."""
+        deadline = time.monotonic() + JOB_DRAIN_TIMEOUT
+        while self.queue.count or self.queue.started_job_registry.count:
+            if time.monotonic() > deadline:
+                print(f"Warning: queue not drained after {JOB_DRAIN_TIMEOUT}s, job count may be inaccurate")
+                return
+            time.sleep(0.5)
+
+    def count_jobs(self, order_ids):
+        """Cuenta los trabajos de validación encolados para los order_id dados."""
+        self.wait_for_queue_drain()
+        job_ids = set(self.queue.job_ids)
+        for registry in (self.queue.started_job_registry, self.queue.finished_job_registry,
+                         self.queue.failed_job_registry, self.queue.deferred_job_registry):
+            job_ids.update(registry.get_job_ids())
+        jobs = Job.fetch_many(list(job_ids), connection=self.queue.connection)
+        return sum(1 for job in jobs if job is not None and job.args and job.args[0].get("order_id") in order_ids)
+
+    def send_sequential(self, order_ids):
+        """Crea las órdenes originales y luego reproduce los duplicados uno a uno."""
+        originals = [self.post_order(order_id) for order_id in order_ids]
+        replays = [self.post_order(order_id) for _ in range(self.replays) for order_id in order_ids]
+        return originals, replays
+
+    def send_concurrent(self, order_ids):
+        """Dispara la orden original y sus reintentos al mismo tiempo."""
+        originals, replays = [], []
+        with ThreadPoolExecutor(max_workers=self.replays + 1) as executor:
+            for order_id in order_ids:
+                results = list(executor.map(self.post_order, [order_id] * (self.replays + 1)))
+                accepted = [r for r in results if r[1].status_code == 200 and not r[1].json().get("duplicate")]
+                if len(accepted) != 1:
+                    print(f"Order {order_id} accepted {len(accepted)} times")
+                original = accepted[0] if accepted else None
+                originals.extend(accepted[:1])
+                replays.extend(r for r in results if r is not original)
+        return originals, replays
+
+    def run(self):
+        """Ejecuta el benchmark y devuelve True si no hubo carga duplicada."""
+        order_ids = [f"dup-test-{uuid.uuid4().hex[:8]}" for _ in range(self.num_orders)]
+
+        mode = "concurrently" if self.concurrent else "sequentially"
+        print(f"\nSending {self.num_orders} orders with {self.replays} replays each, {mode}...")
+        if self.concurrent:
+            originals, replays = self.send_concurrent(order_ids)
+        else:
+            originals, replays = self.send_sequential(order_ids)
+
+        failed = [r for _, r in originals if r.status_code != 200 or r.json().get("duplicate")]
+        retry_later = [r for _, r in replays if r.status_code == 409]
+        unexpected = [r for _, r in replays
+                      if r.status_code != 409 and (r.status_code != 200 or not r.json().get("duplicate"))]
+        for response in failed + unexpected:
+            print(f"Unexpected response: {response.status_code} {response.text}")
+
+        stored = self.count_stored_orders(set(order_ids))
+        jobs_added = self.count_jobs(set(order_ids))
+
+        first_latencies = [latency for latency, _ in originals] or [0]
+        replay_latencies = [latency for latency, _ in replays] or [0]
+        print("\nSummary:")
+        print(f"   Original requests: {len(originals)} "
+              f"(mean {mean(first_latencies):.2f} ms, median {median(first_latencies):.2f} ms)")
+        print(f"   Duplicate requests: {len(replays)} "
+              f"(mean {mean(replay_latencies):.2f} ms, median {median(replay_latencies):.2f} ms)")
+        print(f"   Duplicates answered 409 (retry later): {len(retry_later)}")
+        print(f"   Unexpected responses: {len(failed) + len(unexpected)}")
+        print(f"   Orders stored in database: {stored}/{self.num_orders}")
+        print(f"   Validation jobs enqueued: {jobs_added}/{self.num_orders}")
+        return (len(originals) == self.num_orders and not failed and not unexpected
+                and stored == self.num_orders and jobs_added == self.num_orders)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Duplicate order replay benchmark")
+    parser.add_argument("--orders", type=int, default=10, help="Number of unique orders to create")
+    parser.add_argument("--replays", type=int, default=20, help="Number of retries per order")
+    parser.add_argument("--concurrent", action="store_true",
+                        help="Send retries while the original request is still in flight")
+
+    args = parser.parse_args()
+
+    tester = DuplicateOrderTester(num_orders=args.orders, replays=args.replays, concurrent=args.concurrent)
+    sys.exit(0 if tester.run() else 1)
+
+if __name__ == "__main__":
+    clear_database()
+    main()
@@ -18,6 +18,35 @@ queue = Queue(connection=redis_client)
 # Ruta a la base de datos SQLite
 DATABASE = "data/db.sqlite"
 
+# Llave en Redis con el estado de cada orden aceptada (detección de duplicados)
+ORDER_STATUS_KEY = "order_status:{}"
+ORDER_STATUS_TTL = 24 * 60 * 60  # segundos
+
+# Marcador mientras la orden se guarda y encola; expira pronto si el proceso muere
+ORDER_PENDING = "pending"
+ORDER_PENDING_TTL = 30  # segundos
+
+# Reserva el order_id como "pending" o, si ya existe, devuelve su valor actual (atómico)
+reserve_order = redis_client.register_script("""
+local current = redis.call('GET', KEYS[1])
+if current then
+    return current
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return false
+""")
+
+# Pasa la llave de "pending" a su estado final sin pisar un estado que el worker ya haya escrito
+promote_pending_order = redis_client.register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+end
+return redis.call('EXPIRE', KEYS[1], ARGV[3])
+""")
+
+# Cantidad de llaves borradas por comando en clear_orders
+CLEAR_BATCH_SIZE = 500
+
 def init_db():
     """Inicializa la base de datos SQLite si no existe."""
     conn = sqlite3.connect(DATABASE)
@@ -30,30 +59,104 @@ def init_db():
     conn.commit()
     conn.close()
 
+def order_accepted_response(order_id, status, duplicate):
+    """Respuesta de aceptación, idéntica para la orden original y sus reintentos."""
+    return jsonify({
+        "message": "Order placed successfully!",
+        "order_id": order_id,
+        "status": status,
+        "duplicate": duplicate
+    }), codes.OK
+
+def order_pending_response(order_id):
+    """Respuesta para un reintento que debe volver a intentarse más tarde."""
+    return jsonify({
+        "error": "Order is still being placed, retry later",
+        "order_id": order_id
+    }), codes.CONFLICT
+
+def get_order_status(order_id):
+    """Consulta el estado actual de una orden en SQLite."""
+    conn = sqlite3.connect(DATABASE)
+    c = conn.cursor()
+    c.execute("SELECT status FROM orders WHERE order_id = ?", (order_id,))
+    row = c.fetchone()
+    conn.close()
+    return row[0] if row else None
+
 @app.route("/create_order", methods=["POST"])
 def create_order():
-    """Crea un nuevo pedido, lo guarda en SQLite y lo publica en la cola de Redis con RQ."""
-    data = request.get_json()
+    """Crea un nuevo pedido, lo guarda en SQLite y lo publica en la cola de Redis con RQ.
+
+    Es idempotente por order_id: los reintentos se detectan en Redis antes de
+    tocar SQLite o la cola y reciben la aceptación original con el estado actual.
+    Un reintento que llega mientras la orden original aún se está guardando
+    recibe 409 para que lo vuelva a intentar.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), codes.BAD_REQUEST
+
     order_id = data.get("order_id")
     product = data.get("product")
     quantity = data.get("quantity")
 
+    if not isinstance(order_id, str) or not order_id:
+        return jsonify({"error": "order_id is required and must be a string"}), codes.BAD_REQUEST
+
+    # Reservar el order_id en Redis; si ya existe es un reintento
+    status_key = ORDER_STATUS_KEY.format(order_id)
+    status = reserve_order(keys=[status_key], args=[ORDER_PENDING, ORDER_PENDING_TTL])
+    if status is not None:
+        status = status.decode()
+        if status == ORDER_PENDING:
+            return order_pending_response(order_id)
+        return order_accepted_response(order_id, status, True)
+
     # Guardar el pedido en SQLite
     conn = sqlite3.connect(DATABASE)
-    c = conn.cursor()
-    c.execute("INSERT INTO orders (order_id, product, quantity, status) VALUES (?, ?, ?, ?)",
-              (order_id, product, quantity, OrderStatus.PROCESSING))
-    conn.commit()
+    try:
+        c = conn.cursor()
+        c.execute("INSERT INTO orders (order_id, product, quantity, status) VALUES (?, ?, ?, ?)",
+                  (order_id, product, quantity, OrderStatus.PROCESSING))
+        conn.commit()
+    except sqlite3.IntegrityError:
+        # La llave en Redis expiró pero la orden ya existe: no se vuelve a encolar
+        conn.close()
+        status = get_order_status(order_id)
+        if status is None:
+            # La orden se borró entre el INSERT y la consulta: liberar el order_id
+            redis_client.delete(status_key)
+            return order_pending_response(order_id)
+        promote_pending_order(keys=[status_key], args=[ORDER_PENDING, status, ORDER_STATUS_TTL])
+        return order_accepted_response(order_id, status, True)
+    except Exception:
+        # Liberar el order_id para que el cliente pueda reintentar
+        conn.close()
+        redis_client.delete(status_key)
+        raise
     conn.close()
 
     # Publicar el pedido en la cola usando RQ - encolar datos, no función específica
-    queue.enqueue("app.process_order_validation", {
-        "order_id": order_id,
-        "product": product,
-        "quantity": quantity
-    })
+    try:
+        queue.enqueue("app.process_order_validation", {
+            "order_id": order_id,
+            "product": product,
+            "quantity": quantity
+        })
+    except Exception:
+        # Sin trabajo encolado la orden quedaría en Processing para siempre:
+        # se deshace el registro y se libera el order_id para que el cliente reintente
+        conn = sqlite3.connect(DATABASE)
+        conn.execute("DELETE FROM orders WHERE order_id = ?", (order_id,))
+        conn.commit()
+        conn.close()
+        redis_client.delete(status_key)
+        raise
+
+    promote_pending_order(keys=[status_key], args=[ORDER_PENDING, OrderStatus.PROCESSING, ORDER_STATUS_TTL])
 
-    return jsonify({"message": "Order placed successfully!"}), codes.OK
+    return order_accepted_response(order_id, OrderStatus.PROCESSING, False)
 
 @app.route("/get_orders", methods=["GET"])
 def get_orders():
@@ -99,6 +202,16 @@ def clear_orders():
         c.execute("DELETE FROM orders")
         conn.commit()
         conn.close()
+
+        # Olvidar los order_id aceptados para que puedan volver a usarse
+        keys = []
+        for key in redis_client.scan_iter(match=ORDER_STATUS_KEY.format("*"), count=CLEAR_BATCH_SIZE):
+            keys.append(key)
+            if len(keys) == CLEAR_BATCH_SIZE:
+                redis_client.unlink(*keys)
+                keys = []
+        if keys:
+            redis_client.unlink(*keys)
         
         return jsonify({"message": "All orders cleared successfully!"}), codes.OK
     except Exception as e:
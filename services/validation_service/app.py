@@ -22,6 +22,9 @@ queue = Queue(connection=redis_client)
 
 DATABASE = "data/db.sqlite"
 
+# Llave en Redis con el estado de cada orden (compartida con order_service)
+ORDER_STATUS_KEY = "order_status:{}"
+
 # Circuit Breaker configurado
 external_breaker = CircuitBreaker(
     fail_max=3,
@@ -70,6 +73,9 @@ def update_order_status(order_id, status):
     conn.commit()
     conn.close()
 
+    # Mantener el estado que order_service devuelve a los reintentos, sin renovar el TTL
+    redis_client.set(ORDER_STATUS_KEY.format(order_id), status, xx=True, keepttl=True)
+
 def process_order_validation(order_data):
     """Procesa la validación del pedido - función llamada por RQ worker."""
     order_id = order_data["order_id"]